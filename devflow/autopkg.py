@@ -35,22 +35,13 @@
 
 import os
 import sys
+import shutil
+import tempfile
 import subprocess
 
-from git import GitCommandError
+from git import GitCommandError, Reference
 from optparse import OptionParser
-from sh import mktemp, cd, rm  # pylint: disable=E0611
 from functools import partial
-try:
-    from sh import git_dch as gbp_dch  # pylint: disable=E0611
-    gbp_buildpackage = ['git-buildpackage']
-except ImportError:
-    # In newer versions of git-buildpackage the executables have changed.
-    # Instead of having various git-* executables, there is only a gbp one,
-    # which expects the command (dch, buildpackage, etc) as the first argument.
-    from sh import gbp  # pylint: disable=E0611
-    gbp_dch = partial(gbp, 'dch')
-    gbp_buildpackage = ['gbp', 'buildpackage']
 
 from devflow import versioning
 from devflow import utils
@@ -85,6 +76,27 @@ def print_help(prog):
     print DESCRIPTION % {"prog": prog}
 
 
+def print_line(line):
+    sys.stdout.write(line)
+    sys.stdout.write("\n")
+
+
+def get_gbp_commands():
+    """Return the git-buildpackage commands for dch and buildpackage."""
+    try:
+        from sh import git_dch as gbp_dch  # pylint: disable=E0611
+        gbp_buildpackage = ['git-buildpackage']
+    except ImportError:
+        # In newer versions of git-buildpackage the executables have changed.
+        # Instead of having various git-* executables, there is only a gbp
+        # one, which expects the command (dch, buildpackage, etc) as the
+        # first argument.
+        from sh import gbp  # pylint: disable=E0611
+        gbp_dch = partial(gbp, 'dch')
+        gbp_buildpackage = ['gbp', 'buildpackage']
+    return gbp_dch, gbp_buildpackage
+
+
 def main():
     from devflow.version import __version__  # pylint: disable=E0611,F0401
     parser = OptionParser(usage="usage: %prog [options] mode",
@@ -106,7 +118,8 @@ def main():
     parser.add_option("-r", "--repo-dir",
                       dest="repo_dir",
                       default=None,
-                      help="Directory to clone repository")
+                      help="Directory to clone repository. A clone left"
+                           " there by a previous run is reused.")
     parser.add_option("-d", "--dirty",
                       dest="force_dirty",
                       default=False,
@@ -133,6 +146,12 @@ def main():
                       action="store_true",
                       help="Specifies a source-only build, no binary packages"
                            " need to be made.")
+    parser.add_option("-j", "--jobs",
+                      dest="jobs",
+                      default=None,
+                      type="int",
+                      help="Number of jobs to run simultaneously when"
+                           " building the packages.")
     parser.add_option("--debian-branch",
                       dest="debian_branch",
                       default=None,
@@ -159,19 +178,17 @@ def main():
         use_colors = sys.stdout.isatty()
 
     red = lambda x: x
-    green = lambda x: x
+    print_red = print_green = print_line
 
     if use_colors:
         try:
             import colors
-            red = colors.red
-            green = colors.green
-        except AttributeError:
+            red, green = colors.red, colors.green
+            print_red = lambda x: print_line(red(x))
+            print_green = lambda x: print_line(green(x))
+        except (ImportError, AttributeError):
             pass
 
-    print_red = lambda x: sys.stdout.write(red(x) + "\n")
-    print_green = lambda x: sys.stdout.write(green(x) + "\n")
-
     if options.help:
         print_help(parser.get_prog_name())
         parser.print_help()
@@ -186,6 +203,8 @@ def main():
         raise ValueError(red("Invalid argument! Mode must be one: %s" %
                              ", ".join(AVAILABLE_MODES)))
 
+    gbp_dch, gbp_buildpackage = get_gbp_commands()
+
     # Load the repository
     original_repo = utils.get_repository()
 
@@ -196,7 +215,12 @@ def main():
 
     # Get packages from configuration file
     config = utils.get_config(options.config_file)
-    packages = config['packages'].keys()
+    utils.validate_config(config)
+    packages = []
+    version_files = []
+    for pkg_name, pkg_info in config['packages'].items():
+        packages.append(pkg_name)
+        version_files.extend(utils.config_list(pkg_info, "version_file"))
     print_green("Will build the following packages:\n" + "\n".join(packages))
 
     # Get current branch name and type and check if it is a valid one
@@ -225,23 +249,40 @@ def main():
         debian_branch = utils.get_debian_branch(branch)
     origin_debian = "origin/" + debian_branch
 
-    # Clone the repo
+    # Clone the repo, or reuse a clone left by a previous run
     repo_dir = options.repo_dir or create_temp_directory("df-repo")
     repo_dir = os.path.abspath(repo_dir)
-    repo = original_repo.clone(repo_dir, branch=branch)
-    print_green("Cloned repository to '%s'." % repo_dir)
+    if os.path.isdir(os.path.join(repo_dir, ".git")):
+        origin_branch = "origin/" + branch
+        repo = utils.get_repository(repo_dir)
+        check_reused_clone(original_repo, repo)
+        repo.git.fetch("origin", "+refs/heads/%s:refs/remotes/%s" %
+                       (branch, origin_branch))
+        # The Debian revision depends on the existing debian/* tags, so
+        # mirror the tags of origin, dropping any left by previous runs
+        repo.git.fetch("origin", "--prune", "+refs/tags/*:refs/tags/*")
+        repo.git.reset("--hard")
+        repo.git.clean("-d", "-x", "-f")
+        repo.git.checkout(origin_branch, B=branch)
+        print_green("Updated repository in '%s'." % repo_dir)
+    else:
+        # Only the starting branch is cloned, along with the tags reachable
+        # from it.
+        repo = original_repo.clone(repo_dir, branch=branch,
+                                   single_branch=True)
+        print_green("Cloned repository to '%s'." % repo_dir)
+    # Fetch the debian branch, which is left out by the single-branch clone
+    repo.git.fetch("origin", "+refs/heads/%s:refs/remotes/%s" %
+                   (debian_branch, origin_debian))
 
     build_dir = options.build_dir or create_temp_directory("df-build")
     build_dir = os.path.abspath(build_dir)
     print_green("Build directory: '%s'" % build_dir)
 
-    # Create the debian branch
-    repo.git.branch(debian_branch, origin_debian)
+    # Create the debian branch and go to it
+    repo.git.checkout(origin_debian, B=debian_branch)
     print_green("Created branch '%s' to track '%s'" %
                 (debian_branch, origin_debian))
-
-    # Go to debian branch
-    repo.git.checkout(debian_branch)
     print_green("Changed to branch '%s'" % debian_branch)
 
     # Merge with starting branch
@@ -249,7 +290,7 @@ def main():
     print_green("Merged branch '%s' into '%s'" % (branch, debian_branch))
 
     # Compute python and debian version
-    cd(repo_dir)
+    os.chdir(repo_dir)
     python_version = versioning.get_python_version()
     debian_version = versioning.\
         debian_version_from_python_version(python_version)
@@ -258,10 +299,13 @@ def main():
     # Update the version files
     versioning.update_version()
 
+    # Add version.py files to repo
+    repo.git.add("-f", *version_files)
+
     if not options.sign:
         sign_tag_opt = None
     elif options.keyid:
-        sign_tag_opt = "-u=%s" % options.keyid
+        sign_tag_opt = "-u%s" % options.keyid
     elif mode == "release":
         sign_tag_opt = "-s"
     else:
@@ -271,17 +315,26 @@ def main():
     branch_tag = python_version
     tag_message = "%s version %s" % (mode.capitalize(), python_version)
     try:
-        repo.git.tag(branch_tag, branch, sign_tag_opt, "-m %s" % tag_message)
+        repo.git.tag(branch_tag, branch, sign_tag_opt, m=tag_message)
     except GitCommandError:
         # Tag may already exist, if only the debian branch has changed
         pass
     upstream_tag = "upstream/" + branch_tag
-    repo.git.tag(upstream_tag, branch)
+    # A lightweight tag is just a ref, so write it without running git.
+    # Reference.create() only checks loose refs, so check for an existing
+    # (possibly packed) tag first, like 'git tag' does.
+    if upstream_tag in repo.tags:
+        if repo.tags[upstream_tag].commit != repo.commit(branch):
+            raise RuntimeError(red("Tag '%s' already exists and does not"
+                                   " point to '%s'." % (upstream_tag,
+                                                        branch)))
+    else:
+        Reference.create(repo, "refs/tags/" + upstream_tag, branch)
 
     # Update changelog
     dch = gbp_dch("--debian-branch=%s" % debian_branch,
                   "--git-author",
-                  "--ignore-regex=\".*\"",
+                  "--ignore-regex=.*",
                   "--multimaint-merge",
                   "--since=HEAD",
                   "--new-version=%s" % debian_version)
@@ -294,13 +347,18 @@ def main():
     else:
         distribution = "unstable"
 
-    f = open("debian/changelog", 'r+')
-    lines = f.readlines()
-    lines[0] = lines[0].replace("UNRELEASED", distribution)
-    lines[2] = lines[2].replace("UNRELEASED", "%s build" % mode)
-    f.seek(0)
-    f.writelines(lines)
-    f.close()
+    # Only the header of the new entry needs to change. Stream the rest of
+    # the changelog to a new file instead of reading it in memory.
+    with open("debian/changelog") as src:
+        header = [src.readline() for _ in range(3)]
+        header[0] = header[0].replace("UNRELEASED", distribution)
+        header[2] = header[2].replace("UNRELEASED", "%s build" % mode)
+        fd, new_changelog = tempfile.mkstemp(dir="debian")
+        with os.fdopen(fd, 'w') as dst:
+            dst.writelines(header)
+            shutil.copyfileobj(src, dst)
+    shutil.copymode("debian/changelog", new_changelog)
+    os.rename(new_changelog, "debian/changelog")
 
     if mode == "release":
         subprocess.check_call(['editor', "debian/changelog"])
@@ -314,22 +372,13 @@ def main():
     debian_branch_tag = "debian/" + utils.version_to_tag(debian_version)
     tag_message = "%s version %s" % (mode.capitalize(), debian_version)
     if mode == "release":
-        repo.git.tag(debian_branch_tag, sign_tag_opt, "-m %s" % tag_message)
-
-    # Create debian packages
-    cd(repo_dir)
-    version_files = []
-    for _, pkg_info in config['packages'].items():
-        if pkg_info.get("version_file"):
-            version_files.extend(pkg_info.as_list('version_file'))
-
-    # Add version.py files to repo
-    repo.git.add("-f", *version_files)
+        repo.git.tag(debian_branch_tag, sign_tag_opt, m=tag_message)
 
     # Export version info to debuilg environment
     os.environ["DEB_DEVFLOW_DEBIAN_VERSION"] = debian_version
     os.environ["DEB_DEVFLOW_VERSION"] = python_version
 
+    # Create debian packages
     args = list(gbp_buildpackage)
     args.extend(["--git-export-dir=%s" % build_dir,
                  "--git-upstream-branch=%s" % branch,
@@ -342,17 +391,19 @@ def main():
 
     if options.source_only:
         args.append("-S")
+    if options.jobs:
+        args.append("-j%d" % options.jobs)
     if not options.sign:
         args.extend(["-uc", "-us"])
     elif options.keyid:
-        args.append("-k\"'%s'\"" % options.keyid)
+        args.append("-k%s" % options.keyid)
 
     subprocess.check_call(args)
 
     # Remove cloned repo
     if mode != 'release' and not options.keep_repo:
         print_green("Removing cloned repo '%s'." % repo_dir)
-        rm("-r", repo_dir)
+        shutil.rmtree(repo_dir)
 
     # Print final info
     info = (("Version", debian_version),
@@ -367,9 +418,10 @@ def main():
     # Print help message
     if mode == "release":
         origin = original_repo.remote().url
-        repo.create_remote("original_origin", origin)
-        print_green("Created remote 'original_origin' for the repository '%s'"
-                    % origin)
+        if "original_origin" not in [r.name for r in repo.remotes]:
+            repo.create_remote("original_origin", origin)
+            print_green("Created remote 'original_origin' for the repository"
+                        " '%s'" % origin)
 
         print_green("To update repositories '%s' and '%s' go to '%s' and run:"
                     % (toplevel, origin, repo_dir))
@@ -382,9 +434,36 @@ def main():
             print_green("Automatically updated origin repo.")
 
 
+def check_reused_clone(original_repo, repo):
+    """Check that an existing repository is a clone of the original one.
+
+    A reused clone is reset, cleaned and possibly removed afterwards, so
+    refuse to reuse anything but a clone that autopkg made of the original
+    repository.
+
+    """
+    repo_dir = os.path.realpath(repo.working_dir)
+    if repo_dir == os.path.realpath(original_repo.working_dir):
+        raise RuntimeError("Directory '%s' is the repository being built,"
+                           " not a clone of it." % repo_dir)
+    original_dirs = [original_repo.git_dir,
+                     getattr(original_repo, "common_dir",
+                             original_repo.git_dir)]
+    original_dirs = [os.path.realpath(d) for d in original_dirs]
+    try:
+        origin_url = repo.remote("origin").url
+    except ValueError:
+        origin_url = None
+    if origin_url is None or \
+       os.path.realpath(origin_url) not in original_dirs:
+        raise RuntimeError("Directory '%s' is not a clone of '%s' made by"
+                           " autopkg. Use an empty or non-existing"
+                           " directory." % (repo_dir,
+                                            original_repo.working_dir))
+
+
 def create_temp_directory(suffix):
-    create_dir_cmd = mktemp("-d", "/tmp/" + suffix + "-XXXXX")
-    return create_dir_cmd.stdout.strip()
+    return tempfile.mkdtemp(prefix=suffix + "-", dir="/tmp")
 
 
 if __name__ == "__main__":
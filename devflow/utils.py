@@ -32,14 +32,26 @@
 # or implied, of GRNET S.A.
 
 import os
+import sys
 import git
 import sh
 import re
+import errno
+import hashlib
+import tempfile
+import cPickle
+import ConfigParser
 from collections import namedtuple
-from configobj import ConfigObj
+from StringIO import StringIO
 
 from devflow import BRANCH_TYPES
 
+CONFIG_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "devflow")
+# Bump when the parsed form of the configuration changes
+CONFIG_CACHE_VERSION = 2
+# ConfigObj subsections, e.g. '[[ devflow ]]', are not valid in ConfigParser
+LEGACY_CONFIG_RE = re.compile(r"^\s*\[\[", re.MULTILINE)
+
 
 def get_repository(path=None):
     """Load the repository from the current working dir."""
@@ -62,10 +74,159 @@ def get_config(path=None):
     if not os.path.isfile(path):
         raise RuntimeError("Config file: '%s' does not exist!" % path)
 
-    config = ConfigObj(path)
+    return _load_config(path)
+
+
+def _load_config(path):
+    """Parse a configuration file, reusing a cached result if possible.
+
+    The parsed configuration is cached as a plain dictionary, keyed by the
+    SHA1 of the file contents and CONFIG_CACHE_VERSION.
+
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    cache_file = os.path.join(CONFIG_CACHE_DIR, "conf-v%d-%s.pickle" %
+                              (CONFIG_CACHE_VERSION, digest))
+
+    try:
+        with open(cache_file, "rb") as f:
+            return cPickle.load(f)
+    except Exception:  # pylint: disable=W0703
+        # Missing or unreadable cache, parse the file again
+        pass
+
+    if LEGACY_CONFIG_RE.search(data):
+        config = _parse_legacy_config(path)
+    else:
+        config = _parse_config(data)
+
+    # Failing to update the cache is not fatal
+    try:
+        try:
+            os.makedirs(CONFIG_CACHE_DIR)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp_file = tempfile.mkstemp(dir=CONFIG_CACHE_DIR)
+        with os.fdopen(fd, "wb") as f:
+            cPickle.dump(config, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        pass
     return config
 
 
+def _parse_config(data):
+    """Parse a configuration file with ConfigParser.
+
+    Each package is declared in a '[packages.<name>]' section. Options
+    with comma-separated values are returned as lists.
+
+    """
+    parser = ConfigParser.RawConfigParser()
+    parser.optionxform = str
+    try:
+        parser.readfp(StringIO(data))
+    except ConfigParser.Error as e:
+        raise RuntimeError("Can not parse devflow.conf: %s" % e)
+
+    packages = {}
+    for section in parser.sections():
+        if not section.startswith("packages."):
+            sys.stderr.write("Warning: Ignoring section '%s' of devflow.conf."
+                             " Packages are declared in '[packages.<name>]'"
+                             " sections.\n" % section)
+            continue
+        pkg_info = {}
+        for key, value in parser.items(section):
+            if "," in value:
+                value = [v.strip() for v in value.split(",") if v.strip()]
+            pkg_info[key] = value
+        packages[section.split(".", 1)[1]] = pkg_info
+    if not packages:
+        raise RuntimeError("devflow.conf does not contain any"
+                           " '[packages.<name>]' section!")
+    return {"packages": packages}
+
+
+def _parse_legacy_config(path):
+    """Parse a configuration file using the older ConfigObj syntax."""
+    try:
+        from configobj import ConfigObj
+    except ImportError:
+        raise RuntimeError("devflow.conf uses the old configuration syntax,"
+                           " which requires configobj. Convert it with"
+                           " 'devflow-migrate-config'.")
+    return ConfigObj(path).dict()
+
+
+def write_config(config, f):
+    """Write a configuration in the '[packages.<name>]' syntax."""
+    for pkg_name, pkg_info in sorted(config["packages"].items()):
+        f.write("[packages.%s]\n" % pkg_name)
+        for key, value in pkg_info.items():
+            if not isinstance(value, basestring):
+                value = ", ".join(value)
+            f.write("%s = %s\n" % (key, value))
+        f.write("\n")
+
+
+def migrate_config_main():
+    """Convert a devflow.conf from the old ConfigObj syntax"""
+    try:
+        path = sys.argv[1]
+    except IndexError:
+        path = os.path.join(get_vcs_info().toplevel, "devflow.conf")
+
+    with open(path) as f:
+        if not LEGACY_CONFIG_RE.search(f.read()):
+            sys.stdout.write("File '%s' does not use the old configuration"
+                             " syntax.\n" % path)
+            return
+    config = _parse_legacy_config(path)
+    validate_config(config)
+    with open(path, "w") as f:
+        write_config(config, f)
+    sys.stdout.write("Converted configuration file '%s'\n" % path)
+
+
+def validate_config(config):
+    """Check the structure of the configuration file.
+
+    Catch errors that would otherwise surface only after the repository
+    has been cloned and merged.
+
+    """
+    packages = config.get("packages")
+    if not isinstance(packages, dict) or not packages:
+        raise RuntimeError("devflow.conf does not declare any packages!")
+    for pkg_name, pkg_info in packages.items():
+        if not isinstance(pkg_info, dict):
+            raise RuntimeError("devflow.conf contains '%s' in 'packages',"
+                               " which is not a package section!" % pkg_name)
+        version_files = config_list(pkg_info, "version_file")
+        version_templates = config_list(pkg_info, "version_template")
+        if version_files and version_templates and \
+           len(version_files) != len(version_templates):
+            raise RuntimeError(
+                "devflow.conf contains '%s' version files and '%s' version "
+                "templates for package '%s'. The number of version files and "
+                "templates must match." % (len(version_files),
+                                           len(version_templates), pkg_name))
+
+
+def config_list(section, key):
+    """Return the value of a configuration option as a list."""
+    value = section.get(key)
+    if not value:
+        return []
+    if isinstance(value, basestring):
+        return [value]
+    return list(value)
+
+
 def get_vcs_info():
     """Return current git HEAD commit information.
 
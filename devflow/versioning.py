@@ -390,6 +390,7 @@ def update_version():
     toplevel = v.toplevel
 
     config = utils.get_config()
+    utils.validate_config(config)
     if not v:
         # Return early if not in development environment
         raise RuntimeError("Can not compute version outside of a git"
@@ -408,22 +409,14 @@ def update_version():
            "DEVFLOW_USER_NAME": v.name}
 
     for _pkg_name, pkg_info in config['packages'].items():
-        if pkg_info.get("version_file"):
-            version_filenames = pkg_info.as_list("version_file")
-        else:
+        version_filenames = utils.config_list(pkg_info, "version_file")
+        if not version_filenames:
             continue
-        if pkg_info.get('version_template'):
-            version_templates = pkg_info.as_list("version_template")
-        else:
+        version_templates = utils.config_list(pkg_info, "version_template")
+        if not version_templates:
             version_templates = itertools.repeat(None, len(version_filenames))
             version_templates = list(version_templates)
 
-        if len(version_filenames) != len(version_templates):
-            raise RuntimeError(
-                "devflow.conf contains '%s' version files and '%s' version "
-                "templates. The number of version files and templates must "
-                "match." % (len(version_filenames), len(version_templates)))
-
         v_files_templates = zip(version_filenames, version_templates)
         for (vfilename, vtemplate) in v_files_templates:
             if vtemplate:
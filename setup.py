@@ -80,6 +80,7 @@ setup(
             'devflow-bump-version=devflow.versioning:bump_version_main',
             'devflow-update-version=devflow.versioning:update_version',
             'devflow-autopkg=devflow.autopkg:main',
-            'devflow-flow=devflow.flow:main'],
+            'devflow-flow=devflow.flow:main',
+            'devflow-migrate-config=devflow.utils:migrate_config_main'],
     },
 )
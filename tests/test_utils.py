@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+# Copyright 2012-2016 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+#
+#
+
+
+"""Unit Tests for devflow.utils
+
+Provides unit tests for the parsing and validation of the devflow.conf
+configuration file.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from devflow import utils
+
+
+CONFIG = """
+[packages.devflow]
+version_file = devflow/version.py
+version_template = version_template
+
+[packages.other]
+version_file = other/version.py, other/ui/version.py
+"""
+
+LEGACY_CONFIG = """
+[ packages ]
+  [[ devflow ]]
+    version_file = "devflow/version.py"
+"""
+
+
+class TestParseConfig(unittest.TestCase):
+    def test_single_value(self):
+        config = utils._parse_config(CONFIG)
+        pkg_info = config["packages"]["devflow"]
+        self.assertEqual(pkg_info["version_file"], "devflow/version.py")
+        self.assertEqual(pkg_info["version_template"], "version_template")
+        self.assertEqual(utils.config_list(pkg_info, "version_file"),
+                         ["devflow/version.py"])
+
+    def test_multiple_values(self):
+        config = utils._parse_config(CONFIG)
+        pkg_info = config["packages"]["other"]
+        self.assertEqual(pkg_info["version_file"],
+                         ["other/version.py", "other/ui/version.py"])
+        self.assertEqual(utils.config_list(pkg_info, "version_template"), [])
+
+    def test_missing_packages_section(self):
+        for data in ["", "[packages]\nversion_file = a.py\n",
+                     "[package.devflow]\nversion_file = a.py\n"]:
+            self.assertRaises(RuntimeError, utils._parse_config, data)
+
+    def test_write_config_round_trip(self):
+        config = utils._parse_config(CONFIG)
+        f = StringIO()
+        utils.write_config(config, f)
+        self.assertEqual(utils._parse_config(f.getvalue()), config)
+
+
+class TestLoadConfig(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = utils.CONFIG_CACHE_DIR
+        self.parse_legacy_config = utils._parse_legacy_config
+        utils.CONFIG_CACHE_DIR = os.path.join(self.tmpdir, "cache")
+
+    def tearDown(self):
+        utils.CONFIG_CACHE_DIR = self.cache_dir
+        utils._parse_legacy_config = self.parse_legacy_config
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, data):
+        path = os.path.join(self.tmpdir, "devflow.conf")
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def test_legacy_syntax(self):
+        legacy_config = {"packages": {"devflow": {}}}
+        utils._parse_legacy_config = lambda path: legacy_config
+        path = self._write(LEGACY_CONFIG)
+        self.assertEqual(utils._load_config(path), legacy_config)
+
+    def test_new_syntax(self):
+        def fail(path):
+            raise AssertionError("Parsed '%s' as a legacy file" % path)
+        utils._parse_legacy_config = fail
+        path = self._write(CONFIG)
+        self.assertEqual(utils._load_config(path),
+                         utils._parse_config(CONFIG))
+        # Served from the cache the second time
+        self.assertEqual(len(os.listdir(utils.CONFIG_CACHE_DIR)), 1)
+        self.assertEqual(utils._load_config(path),
+                         utils._parse_config(CONFIG))
+
+
+class TestValidateConfig(unittest.TestCase):
+    def test_valid(self):
+        utils.validate_config(utils._parse_config(CONFIG))
+
+    def test_no_packages(self):
+        self.assertRaises(RuntimeError, utils.validate_config, {})
+        self.assertRaises(RuntimeError, utils.validate_config,
+                          {"packages": {}})
+
+    def test_package_not_a_section(self):
+        self.assertRaises(RuntimeError, utils.validate_config,
+                          {"packages": {"devflow": "devflow/version.py"}})
+
+    def test_templates_mismatch(self):
+        config = {"packages": {"devflow": {
+            "version_file": ["devflow/version.py", "devflow/ui/version.py"],
+            "version_template": "version_template"}}}
+        self.assertRaises(RuntimeError, utils.validate_config, config)
+
+
+if __name__ == '__main__':
+    unittest.main()